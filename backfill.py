@@ -0,0 +1,231 @@
+#!/usr/bin/python3
+
+# No-Hitter Tracker
+#   Scans the final games in a date range (or a whole season) with the same detection logic as main.py and reports every no-hitter, perfect game
+#   and late-inning near-miss with the play that broke it up, to validate detection against known history and tune num_innings_to_alert.
+#   Live feeds are fetched by a bounded thread pool and parsed by a process pool. Final games never change, so their responses are cached on disk
+#   and reruns over the same range don't make any requests.
+#
+#   python3 backfill.py <cache_dir> --start MM/DD/YYYY --end MM/DD/YYYY [--innings INNINGS] [--config CONFIG_PATH]
+#   python3 backfill.py <cache_dir> --season YYYY [--innings INNINGS] [--config CONFIG_PATH]
+
+import os
+import sys
+import gzip
+import json
+import time
+import hashlib
+import logging
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import mlb_api
+import main
+
+BACKFILL_SCHEDULE_FIELDS = ['dates', 'date', 'games', 'gamePk', 'status', 'codedGameState']
+DEFAULT_GAME_TYPES = 'R,F,D,L,W' # Regular season and postseason; spring training and exhibition games are skipped.
+ALERT_TABLE_INNINGS = [5.0, 6.0, 7.0, 8.0, 9.0]
+
+
+def is_game_completed(coded_game_state): # Final and game over; postponed, cancelled and suspended games have no complete feed on the date.
+    return coded_game_state in ['F', 'O']
+
+
+def get_cache_path(cache_dir, path, params):
+    cache_key = mlb_api.build_cache_key(path, params)
+    return os.path.join(cache_dir, hashlib.sha1(cache_key.encode('utf-8')).hexdigest() + '.json.gz')
+
+
+def get_cached_content(cache_dir, path, params): # Returns (cache_path, was_fetched) for the statsapi path, only requesting it if it isn't cached on disk yet.
+    cache_path = get_cache_path(cache_dir, path, params)
+    if os.path.exists(cache_path):
+        return cache_path, False
+
+    content = mlb_api.get_content(path, params)
+    mlb_api.forget(path) # Every response is requested once, so don't keep it in the in-memory cache.
+    if content is not None:
+        temp_path = cache_path + '.' + str(os.getpid()) + '.tmp'
+        with gzip.open(temp_path, 'wb') as file:
+            file.write(content)
+        os.replace(temp_path, cache_path) # An interrupted run never leaves a partial response in the cache.
+    return cache_path, True
+
+
+def read_cached_content(cache_path):
+    with gzip.open(cache_path, 'rb') as file:
+        return file.read()
+
+
+def loads(content):
+    return mlb_api.orjson.loads(content) if mlb_api.orjson is not None else json.loads(content)
+
+
+def get_completed_games(cache_dir, schedule_params, is_cacheable): # Returns a list of (date, game_id) for every completed game in the schedule.
+    params = dict(schedule_params, sportId=1, fields=','.join(BACKFILL_SCHEDULE_FIELDS))
+    if is_cacheable:
+        cache_path, _ = get_cached_content(cache_dir, '/v1/schedule/games/', params)
+        content = read_cached_content(cache_path) if os.path.exists(cache_path) else None
+    else: # The schedule can still change, so it's requested every run and never saved.
+        content = mlb_api.get_content('/v1/schedule/games/', params)
+        mlb_api.forget('/v1/schedule/games/')
+    if content is None:
+        return []
+
+    games = []
+    seen_game_ids = set() # Suspended games are listed on both the original and the resumed date.
+    for date in loads(content).get('dates', []):
+        for game in date['games']:
+            if is_game_completed(game['status']['codedGameState']) and game['gamePk'] not in seen_game_ids:
+                seen_game_ids.add(game['gamePk'])
+                games.append((date['date'], game['gamePk']))
+    return games
+
+
+def get_no_hit_innings(pitching_details, broken_play): # Innings in "baseball" format the team kept the no-hitter, ex: 7.1 if the first hit came with 1 out in the 8th.
+    if pitching_details['hits'] == 0:
+        return float(pitching_details['inningsPitched'])
+    if broken_play is None:
+        return 0.0
+    return float(str(broken_play.completed_innings) + '.' + str(broken_play.completed_outs))
+
+
+def analyze_game(date, game_id, cache_path): # Runs in a worker process; returns a result for each team's pitching in the game.
+    response = loads(read_cached_content(cache_path))
+    game_data = response['gameData']
+    boxscore = response['liveData']['boxscore']
+    all_plays = response['liveData']['plays']['allPlays']
+
+    play_scanner = main.PlayScanner()
+    play_scanner.scan(all_plays)
+
+    results = []
+    for team, opposing_team in [('home', 'away'), ('away', 'home')]:
+        team_boxscore = boxscore['teams'][team]
+        if not team_boxscore['pitchers']:
+            continue
+        pitching_details = main.get_pitching_details(team_boxscore['teamStats']['pitching'])
+        num_pitchers = len(team_boxscore['pitchers'])
+        team_id = game_data['teams'][team]['id']
+        broken_play = play_scanner.home_pitcher_broken_play if team == 'home' else play_scanner.away_pitcher_broken_play
+        downgrade_play = play_scanner.home_pitcher_downgrade_play if team == 'home' else play_scanner.away_pitcher_downgrade_play
+        is_top_inning = team == 'home' # The home team is pitching in the top of the inning.
+        starting_pitcher_name = next((play['matchup']['pitcher']['fullName'] for play in all_plays if play['about']['isTopInning'] == is_top_inning), '')
+
+        results.append({
+            'date': date,
+            'game_id': game_id,
+            'team_abbrv': game_data['teams'][team]['abbreviation'],
+            'opposing_team_abbrv': game_data['teams'][opposing_team]['abbreviation'],
+            'pitcher_name': starting_pitcher_name if num_pitchers == 1 else 'Combined (' + str(num_pitchers) + ' pitchers)',
+            'game_status': main.check_no_hitter(game_id, team_id, pitching_details, num_pitchers),
+            'innings_pitched': pitching_details['inningsPitched'],
+            'no_hit_innings': get_no_hit_innings(pitching_details, broken_play),
+            'broken_by': broken_play.batter_name + ': ' + broken_play.description if broken_play is not None else '',
+            'downgrade_by': downgrade_play.batter_name + ': ' + downgrade_play.description if downgrade_play is not None else '',
+        })
+    return results
+
+
+def backfill(cache_dir, schedule_params, is_cacheable, max_concurrent_requests=8, max_processes=None): # Returns the results for every team in every completed game, ordered by date.
+    os.makedirs(cache_dir, exist_ok=True)
+    games = get_completed_games(cache_dir, schedule_params, is_cacheable)
+    logging.info('backfill:: completed games: ' + str(len(games)))
+
+    params = {'fields': ','.join(main.LIVE_FEED_FIELDS)}
+    results = []
+    num_requests = 0
+    # Workers come from a forkserver so they're never forked while a fetch thread holds a requests/urllib3/logging lock.
+    with ThreadPoolExecutor(max_workers=max_concurrent_requests) as fetch_executor, ProcessPoolExecutor(max_workers=max_processes, mp_context=multiprocessing.get_context('forkserver')) as parse_executor:
+        fetch_futures = {fetch_executor.submit(get_cached_content, cache_dir, '/v1.1/game/' + str(game_id) + '/feed/live', params): (date, game_id) for date, game_id in games}
+        parse_futures = []
+        for fetch_future in as_completed(fetch_futures): # Each feed is parsed as soon as it's on disk, while the rest are still downloading.
+            date, game_id = fetch_futures[fetch_future]
+            cache_path, was_fetched = fetch_future.result()
+            if was_fetched:
+                num_requests += 1
+            if not os.path.exists(cache_path):
+                logging.error('The live feed could not be fetched and the game was skipped. (Game ID: ' + str(game_id) + ')')
+                continue
+            parse_futures.append(parse_executor.submit(analyze_game, date, game_id, cache_path))
+
+        for parse_future in parse_futures:
+            try:
+                results.extend(parse_future.result())
+            except (KeyError, IndexError, TypeError, ValueError) as e: # Very old feeds can be missing fields the tracker relies on.
+                logging.exception('An error occurred and the game was skipped: ' + str(e))
+
+    logging.info('backfill:: requests: ' + str(num_requests) + ', cached: ' + str(len(games) - num_requests))
+    return sorted(results, key=lambda result: (result['date'], result['game_id']))
+
+
+def print_report(results, num_innings_to_alert):
+    REPORT_ROW = '{0:<11} {1:>7} {2:<10} {3:<28} {4:<24} {5:>6} {6:>8}  {7}'
+    print(REPORT_ROW.format('date', 'game', 'team', 'pitcher', 'result', 'ip', 'no-hit', 'broken up by'))
+    for result in results:
+        is_no_hitter = result['game_status'] != 'none' and float(result['innings_pitched']) >= num_innings_to_alert
+        is_near_miss = result['game_status'] == 'none' and result['no_hit_innings'] >= num_innings_to_alert
+        if not is_no_hitter and not is_near_miss:
+            continue
+        print(REPORT_ROW.format(
+            result['date'],
+            result['game_id'],
+            result['team_abbrv'] + ' v ' + result['opposing_team_abbrv'],
+            result['pitcher_name'],
+            result['game_status'] if is_no_hitter else 'near-miss',
+            result['innings_pitched'],
+            str(result['no_hit_innings']),
+            result['broken_by'] if is_near_miss else ('Perfect game broken up by ' + result['downgrade_by'] if result['downgrade_by'] else ''),
+        ))
+
+
+def print_alert_table(results): # How many "current" tweets each num_innings_to_alert would have sent, and how many of them ended as no-hitters.
+    ALERT_ROW = '{0:>16} {1:>8} {2:>12} {3:>10}'
+    print('\n' + ALERT_ROW.format('innings to alert', 'alerts', 'no-hitters', 'hit rate'))
+    for innings in ALERT_TABLE_INNINGS:
+        alerts = [result for result in results if result['no_hit_innings'] >= innings]
+        no_hitters = [result for result in alerts if result['game_status'] != 'none']
+        print(ALERT_ROW.format('%.1f' % innings, len(alerts), len(no_hitters), '%.1f%%' % (100 * len(no_hitters) / len(alerts)) if alerts else '-'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scan historical games for no-hitters, perfect games and near-misses.')
+    parser.add_argument('cache_dir')
+    date_range = parser.add_mutually_exclusive_group(required=True)
+    date_range.add_argument('--start', help='First date to scan, MM/DD/YYYY (use with --end)')
+    date_range.add_argument('--season', type=int, help='Season to scan, ex: 2021')
+    parser.add_argument('--end', help='Last date to scan, MM/DD/YYYY (default: same as --start)')
+    parser.add_argument('--game-types', default=DEFAULT_GAME_TYPES, help='Comma separated statsapi game types (default ' + DEFAULT_GAME_TYPES + ')')
+    parser.add_argument('--innings', type=float, help='Innings without a hit needed to report a game (default: num_innings_to_alert)')
+    parser.add_argument('--processes', type=int, help='Worker processes used to parse the feeds (default: number of CPUs)')
+    parser.add_argument('--config', help='Config file to read num_innings_to_alert and request settings from (default: main.py defaults)')
+    args = parser.parse_args()
+
+    logging.addLevelName(logging.DEBUG, 'DBG')
+    logging.addLevelName(logging.WARNING, 'WRN')
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format='%(asctime)s - [%(levelname).3s] %(message)s')
+
+    config_data = {}
+    if args.config:
+        with open(args.config, 'r') as file:
+            config_data = json.load(file)
+    num_innings_to_alert = args.innings if args.innings is not None else config_data.get('num_innings_to_alert', 6.0)
+    max_concurrent_requests = config_data.get('max_concurrent_requests', 8)
+    mlb_api.init_session(pool_size=max_concurrent_requests, timeout=config_data.get('request_timeout_seconds', 10), max_retries=config_data.get('max_retries', 3))
+
+    today = datetime.date.today()
+    if args.season is not None:
+        schedule_params = {'season': args.season}
+        is_cacheable = args.season < today.year # The schedule of the current season can still change.
+    else:
+        end_date = args.end or args.start
+        schedule_params = {'startDate': args.start, 'endDate': end_date}
+        is_cacheable = datetime.datetime.strptime(end_date, '%m/%d/%Y').date() < today
+    if args.game_types:
+        schedule_params['gameType'] = args.game_types
+
+    start_time = time.perf_counter()
+    results = backfill(args.cache_dir, schedule_params, is_cacheable, max_concurrent_requests, args.processes)
+    print_report(results, num_innings_to_alert)
+    print_alert_table(results)
+    logging.info('backfill:: games: ' + str(len({result['game_id'] for result in results})) + ', seconds: ' + '%.1f' % (time.perf_counter() - start_time))
@@ -1,25 +1,48 @@
 #!/usr/bin/python3
 
 # No-Hitter Tracker
-#   When __main__ runs, the list of games for the current day are retrieved. These games are checked/updated every minute_interval_to_update minutes.
-#   This script needs to be restarted once daily (can be done via system restart/service or a cron job) so that the next day's games are retrieved.
+#   When __main__ runs, the list of games for the current day are retrieved. The schedule is checked/updated every minute_interval_to_update minutes and games with a possible no-hitter in progress are checked every hot_poll_seconds seconds.
+#   In daemon mode the script rolls over to the next day's games on its own, and keeps tracking late games from the previous day until they finish.
 
 import os
 import logging
 import time
+import heapq
+import itertools
+from time import perf_counter
 import datetime
-import requests
 import json
-from twython import Twython, TwythonError
+import mlb_api
+import state_store
+import metrics
+from notifier import Notifier, build_sinks
+from concurrent.futures import ThreadPoolExecutor
+from twython import Twython
 from auth import (CONSUMER_KEY, CONSUMER_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
 
+minute_interval_to_update = 3
 num_innings_to_alert = None
 is_debug_mode = None # Can change this to False to run the bot without sending tweets for testing purposes.
-
-live_team_ids_tweeted = {} # {team_id: {isPerfectGame: False, isFinished: True}}
-finished_team_ids_tweeted = []
-previous_game_ids = {}
+poll_executor = None # Thread pool used to fetch the live feeds of all active games in parallel.
+
+live_team_ids_tweeted = {} # {(game_id, team_id): {isPerfectGame: False, isFinished: True}}
+finished_team_ids_tweeted = [] # [(game_id, team_id)]
+previous_game_ids = {} # {date: {game_id: game_status}} from the last schedule update of each tracked date.
+game_linescores = {} # {game_id: linescore} from the schedule, used to pre-screen games before fetching their full live feed.
+prescreen_innings_margin = 1.0 # The full live feed is fetched for no-hit teams within this many innings of num_innings_to_alert.
+hot_poll_seconds = 15 # Minimum seconds between live feed updates for games with a possible no-hitter in progress.
+idle_poll_minutes = 15 # Minutes between schedule updates while no games are in progress.
+tracked_games = {} # {game_id: GameDetails}
+player_names = {} # {player_id: full_name} cache so tweets never wait on a people lookup.
+SCHEDULE_POLL_KEY = 0 # Poll queue key for schedule updates; game ids are always positive.
+daemon_mode = True # Roll over to the next day's games without restarting the script.
+tracked_dates = [] # Dates whose games are being tracked, oldest first.
+FINAL_STATUS_CODES = ['F', 'O', 'D', 'C', 'T', 'U'] # codedGameState of final, game over, postponed, cancelled and suspended games, which won't change again on their scheduled date.
+# statusCode can't be used for this since it has two letters for rain-shortened, postponed and suspended games, ex: 'FR', 'DR', 'UR'.
+GAME_OVER_STATUS_CODES = ['F', 'O'] # codedGameState of games that were played to the end; 'O' (game over) comes just before 'F' (final).
+SUSPENDED_STATUS_CODES = ['D', 'C', 'T', 'U'] # Games that stopped early; a tweeted state is restored from the state store if they resume on a later date.
 twitter = None
+notifier = None # Sends each rendered tweet to every configured sink from background workers.
 
 REG_CURRENT = '{pitcher_name} ({team_abbrv}) currently has a {game_status} against the {opposing_team} through {innings_pitched} innings.'
 COMBINED_CURRENT = 'The {team_name} currently have a {game_status} against the {opposing_team} through {innings_pitched} innings.'
@@ -35,10 +58,23 @@ BROKEN_BY = 'Broken up by {batter_name} after {inning}.{outs} innings.'
 REG_FINISHED = '{pitcher_name} ({team_abbrv}) has thrown a {game_status} against the {opposing_team}.'
 COMBINED_FINISHED = 'The {team_name} have thrown a {game_status} against the {opposing_team}.'
 
+# Only these fields are requested, so statsapi leaves pitch-level playEvents, player season stats, etc. out of the responses.
+LIVE_FEED_FIELDS = ['metaData', 'timeStamp', 'gameData', 'status', 'codedGameState', 'teams', 'home', 'away', 'id', 'name', 'abbreviation', 'players', 'probablePitchers', 'fullName',
+                    'liveData', 'boxscore', 'pitchers', 'teamStats', 'pitching', 'inningsPitched', 'hits', 'baseOnBalls', 'hitByPitch',
+                    'plays', 'allPlays', 'result', 'type', 'eventType', 'description', 'about', 'inning', 'isTopInning', 'isComplete', 'count', 'outs', 'matchup', 'batter', 'pitcher']
+SCHEDULE_FIELDS = ['dates', 'games', 'gamePk', 'status', 'codedGameState', 'linescore', 'currentInning', 'inningState', 'outs', 'teams', 'home', 'away', 'hits']
+
+PITCHING_DETAILS_KEYS = ['inningsPitched', 'hits', 'baseOnBalls', 'hitByPitch']
+
+HIT_EVENT_TYPES = ['single', 'double', 'triple', 'home_run']
+WALK_OR_ERROR_EVENT_TYPES = ['walk', 'intent_walk', 'hit_by_pitch', 'field_error', 'catcher_interf'] # Batters who reach base without a hit; only breaks up a perfect game.
+
 config_data = {}
 
 
 class PlayDetails:
+    __slots__ = ['description', 'batter_name', 'pitcher_name', 'completed_innings', 'completed_outs', 'is_hit', 'is_walk_or_error']
+
     def __init__(self, play_details, is_hit):
         self.description = play_details['result']['description']
         self.batter_name = play_details['matchup']['batter']['fullName']
@@ -46,144 +82,400 @@ class PlayDetails:
         self.completed_innings = play_details['about']['inning'] - 1 # Subtract 1 for completed innings; 2 outs in the 7th is 6.2 innings pitched
         self.completed_outs = play_details['count']['outs']
         self.is_hit = is_hit
-        self.is_walk_or_error = play_details['result']['eventType'] in ['walk', 'error']
-
-
-class GameDetails:
-    game_id = 0
-    game_status = ''
-
-    home_team_id = 0
-    home_team_name = ''
-    home_team_abbrv = ''
-    num_home_pitchers = 0
-    home_pitcher_id = ''
-    home_pitching_details = {}
-
-    away_team_id = 0
-    away_team_name = ''
-    away_team_abbrv = ''
-    num_away_pitchers = 0
-    away_pitcher_id = ''
-    away_pitching_details = {}
-    
-    def __init__(self, game_id):
-        self.game_id = game_id
+        self.is_walk_or_error = play_details['result']['eventType'] in WALK_OR_ERROR_EVENT_TYPES
+
+
+def get_pitching_details(team_pitching_stats): # Copies only the pitching stats used by check_no_hitter out of the boxscore.
+    return {key: team_pitching_stats[key] for key in PITCHING_DETAILS_KEYS}
+
+
+def classify_play(play_details): # Returns (is_top_inning, is_hit, is_walk_or_error) for a play from allPlays.
+    play_result = play_details['result']
+    play_event_type = play_result.get('eventType', '')
+    is_walk_or_error = play_event_type in WALK_OR_ERROR_EVENT_TYPES
+    is_hit = play_result['type'] == 'atBat' and play_event_type in HIT_EVENT_TYPES
+    return play_details['about']['isTopInning'], is_hit, is_walk_or_error
+
+
+class PlayScanner: # Classifies each play of a game once, keeping only the plays that broke up each side's no-hitter/perfect game.
+    __slots__ = ['next_play_index', 'home_pitcher_broken_play', 'home_pitcher_downgrade_play', 'away_pitcher_broken_play', 'away_pitcher_downgrade_play']
+
+    def __init__(self):
+        self.next_play_index = 0 # Index into allPlays of the first play that hasn't been classified yet.
         self.home_pitcher_broken_play = None
         self.home_pitcher_downgrade_play = None
         self.away_pitcher_broken_play = None
         self.away_pitcher_downgrade_play = None
-        self.set_live_game_details()
-    
-    def set_live_game_details(self):
-        request_endpoint = 'http://statsapi.mlb.com/api/v1.1/game/' + str(self.game_id) + '/feed/live'
-        
-        try:
-            response = requests.get(request_endpoint)
-            if response.status_code == 200:
-                response = response.json()
-                
-                game_data = response['gameData']
-                status = game_data['status']
-                home_team_details = game_data['teams']['home']
-                away_team_details = game_data['teams']['away']
-                
-                live_data = response['liveData']
-                boxscore = live_data['boxscore']
-                home_team_boxscore = boxscore['teams']['home']
-                away_team_boxscore = boxscore['teams']['away']
 
-                self.game_status = status['statusCode']
-                self.plays = live_data['plays']
-                
-                self.home_team_id = home_team_details['id']
-                self.home_team_name = home_team_details['name']
-                self.home_team_abbrv = home_team_details['abbreviation']
-                self.num_home_pitchers = len(home_team_boxscore['pitchers'])
-                self.home_pitcher_id = home_team_boxscore['pitchers'][0] if self.num_home_pitchers > 0 else 0  # to prevent list index out of range error
-                self.home_pitching_details = home_team_boxscore['teamStats']['pitching']
-
-                self.away_team_id = away_team_details['id']
-                self.away_team_name = away_team_details['name']
-                self.away_team_abbrv = away_team_details['abbreviation']
-                self.num_away_pitchers = len(away_team_boxscore['pitchers'])
-                self.away_pitcher_id = away_team_boxscore['pitchers'][0] if self.num_away_pitchers > 0 else 0  # to prevent list index out of range error
-                self.away_pitching_details = away_team_boxscore['teamStats']['pitching']
-        except requests.exceptions.RequestException as e:
-            logging.exception(e)
-        except ConnectionError as e:
-            logging.exception(e)
-    
-    def set_broken_details(self):
-        if self.home_pitcher_broken_play == None or self.away_pitcher_broken_play == None:
-            all_plays = self.plays['allPlays']
-        
-            for play_details in all_plays:
-                play_result = play_details['result']
-                play_type = play_result['type']
-                play_event_type = play_result['eventType']
-                is_out = play_result['isOut']
-                is_top_inning = play_details['about']['isTopInning']
-                is_walk_or_error = play_event_type in ['walk', 'error']
-                is_hit = play_type == 'atBat' and not is_out and play_event_type not in ['walk', 'error', 'fielders_choice']
-                
-                if self.home_pitcher_broken_play == None and is_top_inning:
-                    if is_hit:
+    def scan(self, all_plays): # Only classifies the plays completed since the last scan, so the work per update grows with the new plays instead of the whole game.
+        while self.next_play_index < len(all_plays):
+            play_details = all_plays[self.next_play_index]
+            if not play_details['about'].get('isComplete', True): # The current at-bat is still in progress; pick it up on the next scan.
+                break
+            self.next_play_index += 1
+
+            is_top_inning, is_hit, is_walk_or_error = classify_play(play_details)
+            if is_top_inning: # The home team is pitching in the top of the inning.
+                if is_hit:
+                    if self.home_pitcher_broken_play == None:
                         self.home_pitcher_broken_play = PlayDetails(play_details, is_hit)
-                    elif self.home_pitcher_downgrade_play == None and is_walk_or_error:
+                elif is_walk_or_error:
+                    if self.home_pitcher_downgrade_play == None:
                         self.home_pitcher_downgrade_play = PlayDetails(play_details, is_hit)
-                elif self.away_pitcher_broken_play == None and not is_top_inning:
-                    if is_hit:
+            else:
+                if is_hit:
+                    if self.away_pitcher_broken_play == None:
                         self.away_pitcher_broken_play = PlayDetails(play_details, is_hit)
-                    elif self.away_pitcher_downgrade_play == None and is_walk_or_error:
+                elif is_walk_or_error:
+                    if self.away_pitcher_downgrade_play == None:
                         self.away_pitcher_downgrade_play = PlayDetails(play_details, is_hit)
 
 
+class GameDetails: # Only keeps the fields the tracker uses between updates; the feed itself is dropped after each update.
+    __slots__ = ['game_id', 'game_date', 'game_status', 'feed_timestamp',
+                 'home_team_id', 'home_team_name', 'home_team_abbrv', 'num_home_pitchers', 'home_pitcher_id', 'home_pitching_details',
+                 'away_team_id', 'away_team_name', 'away_team_abbrv', 'num_away_pitchers', 'away_pitcher_id', 'away_pitching_details',
+                 'play_scanner']
+    
+    def __init__(self, game_id, game_date=''):
+        self.game_id = game_id
+        self.game_date = game_date
+        self.game_status = ''
+        self.feed_timestamp = '' # metaData.timeStamp of the last processed feed; the feed is only reprocessed when this changes.
+
+        self.home_team_id = 0
+        self.home_team_name = ''
+        self.home_team_abbrv = ''
+        self.num_home_pitchers = 0
+        self.home_pitcher_id = 0
+        self.home_pitching_details = {}
+
+        self.away_team_id = 0
+        self.away_team_name = ''
+        self.away_team_abbrv = ''
+        self.num_away_pitchers = 0
+        self.away_pitcher_id = 0
+        self.away_pitching_details = {}
+
+        self.play_scanner = PlayScanner()
+    
+    def set_live_game_details(self):
+        fields = LIVE_FEED_FIELDS + ['ID' + str(pitcher_id) for pitcher_id in [self.home_pitcher_id, self.away_pitcher_id] if pitcher_id] # Player entries are keyed by id.
+        response = mlb_api.get_json('/v1.1/game/' + str(self.game_id) + '/feed/live', {'fields': ','.join(fields)})
+        
+        if response is not None and response is not mlb_api.NOT_MODIFIED:
+            feed_timestamp = response['metaData']['timeStamp']
+            if feed_timestamp == self.feed_timestamp: # Nothing has changed since the last update.
+                return
+            self.feed_timestamp = feed_timestamp
+
+            game_data = response['gameData']
+            status = game_data['status']
+            home_team_details = game_data['teams']['home']
+            away_team_details = game_data['teams']['away']
+            
+            live_data = response['liveData']
+            boxscore = live_data['boxscore']
+            home_team_boxscore = boxscore['teams']['home']
+            away_team_boxscore = boxscore['teams']['away']
+
+            self.game_status = status['codedGameState']
+            
+            self.home_team_id = home_team_details['id']
+            self.home_team_name = home_team_details['name']
+            self.home_team_abbrv = home_team_details['abbreviation']
+            self.num_home_pitchers = len(home_team_boxscore['pitchers'])
+            self.home_pitcher_id = home_team_boxscore['pitchers'][0] if self.num_home_pitchers > 0 else 0  # to prevent list index out of range error
+            self.home_pitching_details = get_pitching_details(home_team_boxscore['teamStats']['pitching'])
+
+            self.away_team_id = away_team_details['id']
+            self.away_team_name = away_team_details['name']
+            self.away_team_abbrv = away_team_details['abbreviation']
+            self.num_away_pitchers = len(away_team_boxscore['pitchers'])
+            self.away_pitcher_id = away_team_boxscore['pitchers'][0] if self.num_away_pitchers > 0 else 0  # to prevent list index out of range error
+            self.away_pitching_details = get_pitching_details(away_team_boxscore['teamStats']['pitching'])
+
+            player_names.update(get_pitcher_names_from_feed(game_data, live_data['plays']['allPlays'], [self.home_pitcher_id, self.away_pitcher_id]))
+
+            self.play_scanner.scan(live_data['plays']['allPlays'])
+
+
+def get_schedule_params(date):
+    return {'sportId': 1, 'date': date, 'hydrate': 'linescore', 'fields': ','.join(SCHEDULE_FIELDS)}
+
+
+def get_pitcher_names_from_feed(game_data, all_plays, pitcher_ids): # Returns {pitcher_id: full_name} for the pitchers named anywhere in the feed, so they're never looked up with /v1/people.
+    # The players entries are only requested once the pitcher ids are known, so the first feed of a game names its pitchers in probablePitchers and the play matchups instead.
+    missing_pitcher_ids = {pitcher_id for pitcher_id in pitcher_ids if pitcher_id and pitcher_id not in player_names}
+    pitcher_names = {}
+    for pitcher_id in list(missing_pitcher_ids):
+        player_details = game_data.get('players', {}).get('ID' + str(pitcher_id))
+        if player_details is not None and 'fullName' in player_details:
+            pitcher_names[pitcher_id] = player_details['fullName']
+            missing_pitcher_ids.discard(pitcher_id)
+    
+    named_pitchers = itertools.chain(game_data.get('probablePitchers', {}).values(), (play_details['matchup']['pitcher'] for play_details in all_plays if 'matchup' in play_details))
+    for pitcher_details in named_pitchers:
+        if not missing_pitcher_ids: # Starting pitchers show up in the first plays, so this rarely looks past the first inning.
+            break
+        if pitcher_details.get('id') in missing_pitcher_ids and 'fullName' in pitcher_details:
+            pitcher_names[pitcher_details['id']] = pitcher_details['fullName']
+            missing_pitcher_ids.discard(pitcher_details['id'])
+    return pitcher_names
+
+
 def get_game_ids_by_date(date): # Returns a map of { game_id: game_status } for all games on the specified date.
-    global previous_game_ids
     ids = {}
-    params = {'sportId': 1, 'date': date}
-    request_endpoint = 'http://statsapi.mlb.com/api/v1/schedule/games/'
+    response = mlb_api.get_json('/v1/schedule/games/', get_schedule_params(date))
+    if response is mlb_api.NOT_MODIFIED: # The statuses and linescores are the same as the last time.
+        return dict(previous_game_ids.get(date, {}))
     
-    try:
-        response = requests.get(request_endpoint, params)
-        if response.status_code == 200:
-            if response.json()['dates']:
-                games = response.json()['dates'][0]['games']
-                for game in games:
-                    ids[game['gamePk']] = game['status']['statusCode']
-            
-            if ids != previous_game_ids: # Only print the ids map if it's different than the previous time this was run.
-                previous_game_ids = ids
-                logging.debug('get_game_ids_by_date:: ids: ' + str(ids))
-    except requests.exceptions.RequestException as e:
-        logging.exception(e)
-    except ConnectionError as e:
-        logging.exception(e)
+    if response is not None:
+        if response['dates']:
+            games = response['dates'][0]['games']
+            for game in games:
+                ids[game['gamePk']] = game['status']['codedGameState']
+                game_linescores[game['gamePk']] = game.get('linescore', {})
+        
+        if ids != previous_game_ids.get(date): # Only print the ids map if it's different than the previous time this was run for the date.
+            previous_game_ids[date] = ids
+            logging.debug('get_game_ids_by_date:: ids: ' + str(ids))
     
     return ids
 
 
+def get_player_names_by_ids(player_ids): # Looks up the names of all players that aren't cached yet in a single request.
+    missing_player_ids = [player_id for player_id in set(player_ids) if player_id and player_id not in player_names]
+    if missing_player_ids:
+        params = {'personIds': ','.join(str(player_id) for player_id in sorted(missing_player_ids)), 'fields': 'people,id,fullName'}
+        response = mlb_api.get_json('/v1/people', params)
+        
+        if response is not None and response is not mlb_api.NOT_MODIFIED:
+            for player_details in response.get('people', []):
+                player_names[player_details['id']] = player_details['fullName']
+    return {player_id: player_names.get(player_id, '') for player_id in player_ids}
+
+
 def get_player_name_by_id(player_id):
-    player_name = ''
-    request_endpoint = 'http://statsapi.mlb.com/api/v1/people/' + str(player_id)
+    if player_id in player_names:
+        return player_names[player_id]
+    return get_player_names_by_ids([player_id])[player_id]
+
+
+def get_linescore_innings_pitched(linescore, team): # Returns the innings pitched by the team's pitchers in "baseball" format (6.2 is 6 innings + 2 outs) based on the linescore.
+    current_inning = linescore.get('currentInning', 0)
+    inning_state = linescore.get('inningState', '')
+    outs = linescore.get('outs', 0)
     
-    try:
-        response = requests.get(request_endpoint)
-        if response.status_code == 200:
-            player_name = response.json()['people'][0]['fullName']
-    except requests.exceptions.RequestException as e:
-        logging.exception(e)
-    except ConnectionError as e:
-        logging.exception(e)
-    return player_name
+    if team == 'home': # The home team pitches in the top of the inning.
+        if inning_state == 'Top':
+            return current_inning - 1 + outs / 10
+        return float(current_inning)
+    else:
+        if inning_state == 'Bottom':
+            return current_inning - 1 + outs / 10
+        elif inning_state == 'End':
+            return float(current_inning)
+        return float(max(current_inning - 1, 0))
+
+
+def get_tweeted_team_keys(game_id): # Matches by game id alone; after a restart the team ids aren't known until the game's live feed is loaded.
+    return [team_key for team_key in live_team_ids_tweeted if team_key[0] == game_id]
+
+
+def needs_live_game_details(game): # Pre-screens the game with its schedule linescore so the full live feed is only fetched when a no-hitter could be tweeted.
+    if get_tweeted_team_keys(game.game_id): # Needs the feed to follow up on a tweeted no-hitter.
+        return True
+    
+    linescore = game_linescores.get(game.game_id)
+    if linescore is None or 'teams' not in linescore:
+        return linescore is None # No pre-screen data available for this game.
+    
+    for team, opposing_team in [('home', 'away'), ('away', 'home')]:
+        num_hits_allowed = linescore['teams'][opposing_team].get('hits', 0)
+        if num_hits_allowed == 0 and get_linescore_innings_pitched(linescore, team) >= num_innings_to_alert - prescreen_innings_margin:
+            return True
+    return False
+
+
+def has_pending_follow_up(game_id): # Returns True if a tweeted no-hitter in the game still needs its "broken" or "finished" tweet.
+    return any(team_key not in finished_team_ids_tweeted for team_key in get_tweeted_team_keys(game_id))
+
+
+def is_game_hot(game): # Returns True if the game's live feed should be polled on its own schedule instead of waiting on the next schedule update.
+    if has_pending_follow_up(game.game_id):
+        return game.game_status in ['I'] + GAME_OVER_STATUS_CODES
+    if game.game_status != 'I':
+        return False
+    if game.feed_timestamp != '' and game.home_pitching_details.get('hits', 0) > 0 and game.away_pitching_details.get('hits', 0) > 0: # Neither team can throw a no-hitter anymore.
+        return False
+    return needs_live_game_details(game)
+
+
+def get_hot_poll_interval(num_hot_games, num_live_games): # Spreads the request budget of one live feed per in-progress game per update interval across the hot games.
+    return max(hot_poll_seconds, minute_interval_to_update * 60 * num_hot_games / max(num_live_games, 1))
+
+
+def fetch_live_game_details(games): # Fetches the live feed of every game in parallel so a cycle takes about as long as the slowest game.
+    if poll_executor is None:
+        for game in games:
+            game.set_live_game_details()
+    else:
+        list(poll_executor.map(lambda game: game.set_live_game_details(), games))
+    
+    get_player_names_by_ids([game.home_pitcher_id for game in games] + [game.away_pitcher_id for game in games]) # Only pitchers missing from their feed are looked up.
+
+
+def check_game(game):
+    if game.feed_timestamp == '': # The live feed has never been loaded for this game.
+        return
+    
+    home_no_hitter_status = check_no_hitter(game.game_id, game.home_team_id, game.home_pitching_details, game.num_home_pitchers)
+    logging.debug('main:: game_id: ' + str(game.game_id) + ', home_no_hitter_status: ' + home_no_hitter_status + ', home_team_id: ' + str(game.home_team_id) + ', num_home_pitchers: ' + str(game.num_home_pitchers))
+    if home_no_hitter_status != 'none':
+        is_final = game.game_status in GAME_OVER_STATUS_CODES # Includes rain-shortened games
+        send_no_hitter_tweet(game, 'home', home_no_hitter_status, is_final)
+
+    away_no_hitter_status = check_no_hitter(game.game_id, game.away_team_id, game.away_pitching_details, game.num_away_pitchers)
+    logging.debug('main:: game_id: ' + str(game.game_id) + ', away_no_hitter_status: ' + away_no_hitter_status + ', away_team_id: ' + str(game.away_team_id) + ', num_away_pitchers: ' + str(game.num_away_pitchers))
+    if away_no_hitter_status != 'none':
+        is_final = game.game_status in GAME_OVER_STATUS_CODES # Includes rain-shortened games
+        send_no_hitter_tweet(game, 'away', away_no_hitter_status, is_final)
+
+
+def update_tracked_games(date): # Updates the status of every tracked game from the schedule and starts tracking any new games.
+    game_ids = get_game_ids_by_date(date) # Contains { id: game_status } mapping.
+    for game_id, game_status in game_ids.items():
+        if game_id not in tracked_games:
+            tracked_games[game_id] = GameDetails(game_id, date)
+            load_tweeted_state(game_id)
+        tracked_games[game_id].game_date = date # Suspended games resumed on a later date move to that date.
+        tracked_games[game_id].game_status = game_status
+
+
+def is_game_done(game): # Returns True once nothing else will be tweeted for the game on its date.
+    if has_pending_follow_up(game.game_id): # Kept until the follow-up is sent, unless the game was suspended or postponed.
+        return game.game_status in SUSPENDED_STATUS_CODES
+    return game.game_status in FINAL_STATUS_CODES and not is_game_hot(game)
+
+
+def update_tracked_dates(): # Rolls over to the current date and stops tracking earlier dates once all of their games are over.
+    if daemon_mode:
+        current_date = datetime.date.today().strftime('%m/%d/%Y')
+        if current_date not in tracked_dates:
+            tracked_dates.append(current_date)
+            logging.info('\nDate: ' + current_date)
+    
+    for date in tracked_dates:
+        update_tracked_games(date)
+    
+    for date in tracked_dates[:-1]: # Late games from earlier dates are tracked until they finish, even after midnight.
+        date_games = [game for game in tracked_games.values() if game.game_date == date]
+        if all(is_game_done(game) for game in date_games):
+            for game in date_games:
+                forget_game(game.game_id)
+            tracked_dates.remove(date)
+            previous_game_ids.pop(date, None)
+            mlb_api.forget('/v1/schedule/games/', get_schedule_params(date))
+            mlb_api.forget('/v1/people') # Names are kept in player_names, so the lookups made for the date's games aren't needed anymore.
+            logging.info('Finished tracking games for date: ' + date)
+
+
+def run_poll_loop():
+    # Poll queue of (deadline, key) entries. The schedule (key SCHEDULE_POLL_KEY) is updated every minute_interval_to_update minutes while games are in progress,
+    # which also pre-screens every game. Only hot games get their own entry, so their live feeds are polled every few seconds.
+    poll_queue = [(time.time(), SCHEDULE_POLL_KEY)]
+    queued_game_ids = set()
+    schedule_interval = minute_interval_to_update * 60
+    
+    while True:
+        deadline, key = heapq.heappop(poll_queue)
+        time.sleep(max(deadline - time.time(), 0))
+        metrics.set_gauge('nohitter_poll_lag_seconds', 'How late the last poll started after its deadline.', max(time.time() - deadline, 0))
+        cycle_start_time = perf_counter()
+        
+        due_keys = [key]
+        while poll_queue and poll_queue[0][0] <= time.time():
+            due_keys.append(heapq.heappop(poll_queue)[1])
+        
+        if SCHEDULE_POLL_KEY in due_keys:
+            schedule_start_time = perf_counter()
+            update_tracked_dates()
+            metrics.observe('nohitter_schedule_update_seconds', 'Time spent updating the schedule of every tracked date.', perf_counter() - schedule_start_time)
+            is_any_game_live = any(game.game_status == 'I' for game in tracked_games.values())
+            schedule_interval = minute_interval_to_update * 60 if is_any_game_live else idle_poll_minutes * 60 # Scheduled, delayed and finished games are checked rarely.
+            heapq.heappush(poll_queue, (time.time() + schedule_interval, SCHEDULE_POLL_KEY))
+            
+            for game in tracked_games.values():
+                if game.game_id not in queued_game_ids and is_game_hot(game):
+                    due_keys.append(game.game_id)
+                    queued_game_ids.add(game.game_id)
+        
+        due_keys = [game_id for game_id in due_keys if game_id == SCHEDULE_POLL_KEY or game_id in tracked_games]
+        queued_game_ids.intersection_update(tracked_games.keys())
+        hot_games = [tracked_games[game_id] for game_id in due_keys if game_id != SCHEDULE_POLL_KEY and is_game_hot(tracked_games[game_id])]
+        fetch_live_game_details(hot_games)
+        for game in hot_games:
+            check_game(game)
+        metrics.set_gauge('nohitter_games_polled', 'Live feeds fetched in the last cycle.', len(hot_games))
+        metrics.inc_counter('nohitter_games_polled_total', 'Live feeds fetched.', len(hot_games))
+        
+        num_live_games = sum(1 for game in tracked_games.values() if game.game_status == 'I')
+        hot_poll_interval = get_hot_poll_interval(len(queued_game_ids), num_live_games)
+        for game_id in due_keys:
+            if game_id == SCHEDULE_POLL_KEY:
+                continue
+            if is_game_hot(tracked_games[game_id]):
+                heapq.heappush(poll_queue, (time.time() + hot_poll_interval, game_id))
+            else: # Games that can no longer qualify are dropped until a schedule update makes them hot again.
+                queued_game_ids.discard(game_id)
+        
+        cycle_duration = perf_counter() - cycle_start_time
+        cycle_interval = hot_poll_interval if queued_game_ids else schedule_interval
+        metrics.observe('nohitter_cycle_seconds', 'Time spent on one poll cycle, excluding the sleep.', cycle_duration)
+        metrics.set_gauge('nohitter_cycle_interval_seconds', 'Interval the last poll cycle had to finish within.', cycle_interval)
+        if cycle_duration > cycle_interval:
+            metrics.inc_counter('nohitter_cycle_overruns_total', 'Poll cycles that took longer than their interval.')
+            logging.warning('Poll cycle took ' + str(round(cycle_duration, 1)) + ' seconds, longer than its ' + str(cycle_interval) + ' second interval.')
+        metrics.set_gauge('nohitter_tracked_games', 'Games being tracked.', len(tracked_games))
+        metrics.set_gauge('nohitter_hot_games', 'Games with a possible no-hitter polled on their own schedule.', len(queued_game_ids))
+
+
+def save_tweeted_state(game_details, team_id): # Persists the team's tweeted state as soon as its tweet is queued so it survives a restart.
+    team_state = live_team_ids_tweeted[(game_details.game_id, team_id)]
+    state_store.save_team_state(game_details.game_date, game_details.game_id, team_id, team_state['isPerfectGame'], team_state['isFinished'])
+
+
+def load_tweeted_state(game_id): # Restores the tweeted state saved for the specified game, including games suspended and resumed on a later date.
+    for team_id, is_perfect_game, is_finished in state_store.load_game_states(game_id):
+        team_key = (game_id, team_id)
+        live_team_ids_tweeted[team_key] = {'isPerfectGame': is_perfect_game, 'isFinished': is_finished}
+        if is_finished and team_key not in finished_team_ids_tweeted:
+            finished_team_ids_tweeted.append(team_key)
+        logging.info('Tweeted state restored: game_id: ' + str(game_id) + ', team_id: ' + str(team_id) + ', state: ' + str(live_team_ids_tweeted[team_key]))
+
+
+def forget_game(game_id): # Drops everything held in memory for a game that is no longer tracked.
+    tracked_games.pop(game_id, None)
+    game_linescores.pop(game_id, None)
+    mlb_api.forget('/v1.1/game/' + str(game_id) + '/feed/live')
+    for team_key in get_tweeted_team_keys(game_id):
+        del live_team_ids_tweeted[team_key]
+        if team_key in finished_team_ids_tweeted:
+            finished_team_ids_tweeted.remove(team_key)
+
+
+def notify(game_details, team_id, event, status, message): # Hands the rendered tweet to the notifier so the detection loop never waits on a sink.
+    key = str(game_details.game_id) + ':' + str(team_id) + ':' + event
+    if notifier.put(key, status):
+        logging.info('Notification queued: ' + message + ' (Game ID: ' + str(game_details.game_id) + ')')
 
 
 def build_status(message, home_team_abbrv, away_team_abbrv):
     return message + '\n\n#' + home_team_abbrv + "vs" + away_team_abbrv + " | #" + away_team_abbrv + "vs" + home_team_abbrv
 
 
-def check_no_hitter(team_id, pitching_details, num_pitchers):
+def check_no_hitter(game_id, team_id, pitching_details, num_pitchers):
     status = 'none'
     is_combined = num_pitchers > 1
     innings_pitched = float(pitching_details['inningsPitched'])
@@ -195,18 +487,19 @@ def check_no_hitter(team_id, pitching_details, num_pitchers):
         is_perfect_game = num_walks_allowed == 0 and num_batters_hit == 0
         if is_perfect_game:
             status = 'combined perfect game' if is_combined else 'perfect game'
-        elif team_id in live_team_ids_tweeted and live_team_ids_tweeted[team_id]['isPerfectGame']:
+        elif (game_id, team_id) in live_team_ids_tweeted and live_team_ids_tweeted[(game_id, team_id)]['isPerfectGame']:
             status = 'combined downgrade' if is_combined else 'downgrade'
         else:
             status = 'combined no-hitter' if is_combined else 'no-hitter'
-    elif num_hits_allowed > 0 and team_id in live_team_ids_tweeted:
+    elif num_hits_allowed > 0 and (game_id, team_id) in live_team_ids_tweeted:
         status = 'combined broken' if is_combined else 'broken'
     return status
 
 
 def send_no_hitter_tweet(game_details, no_hitter_team, game_status, is_game_finished):
-    if twitter is not None and no_hitter_team in ['home', 'away'] and game_status in ['no-hitter', 'perfect game', 'combined no-hitter', 'combined perfect game', 'broken', 'combined broken']:
+    if notifier is not None and no_hitter_team in ['home', 'away'] and game_status in ['no-hitter', 'perfect game', 'combined no-hitter', 'combined perfect game', 'broken', 'combined broken', 'downgrade', 'combined downgrade']:
         team_id = game_details.home_team_id if no_hitter_team == 'home' else game_details.away_team_id
+        team_key = (game_details.game_id, team_id) # Teams are tracked per game so doubleheaders are handled separately.
         pitcher_name = get_player_name_by_id(
             game_details.home_pitcher_id) if no_hitter_team == 'home' else get_player_name_by_id(
             game_details.away_pitcher_id)
@@ -219,39 +512,34 @@ def send_no_hitter_tweet(game_details, no_hitter_team, game_status, is_game_fini
         logging.debug(SEND_NO_HITTER_TWEET_LOG.format(game_details.game_id, game_status, team_id, pitcher_name, team_abbrv, team_name, opposing_team, innings_pitched))
 
         if float(innings_pitched) >= num_innings_to_alert:  # only create new Tweet for no-hitters that are past the num_innings_to_alert
-            if team_id in live_team_ids_tweeted and team_id not in finished_team_ids_tweeted:
-                if game_status in ['broken', 'combined broken', 'downgrade', 'combined downgrade']: # Games that had a no-hitter through 6 innings but are now broken up.
-                    game_details.set_broken_details()
-                    
-                    if game_status in ['broken', 'combined broken']:
-                        broken_play_details = game_details.home_pitcher_broken_play if no_hitter_team == 'home' else game_details.away_pitcher_broken_play
+            if team_key in live_team_ids_tweeted and team_key not in finished_team_ids_tweeted and game_status in ['broken', 'combined broken', 'downgrade', 'combined downgrade']: # Games that had a no-hitter through 6 innings but are now broken up.
+                if game_status in ['broken', 'combined broken']:
+                    broken_play_details = game_details.play_scanner.home_pitcher_broken_play if no_hitter_team == 'home' else game_details.play_scanner.away_pitcher_broken_play
+                    broken_by_message = ''
+                    if broken_play_details is not None: # The breaking play may not be complete in allPlays yet even though the boxscore has the hit.
                         broken_by_message = BROKEN_BY.format(batter_name=broken_play_details.batter_name, inning=broken_play_details.completed_innings, outs=broken_play_details.completed_outs)
-                        
-                        if game_status == 'broken':
-                            message = REG_BROKEN.format(pitcher_name=pitcher_name, team_abbrv=team_abbrv, opposing_team=opposing_team) + '\n\n' + broken_by_message
-                        elif game_status == 'combined broken':
-                            message = COMBINED_BROKEN.format(team_name=team_name, opposing_team=opposing_team) + '\n\n' + broken_by_message
-                    else: # downgrade
-                        downgrade_play_details = game_details.home_pitcher_downgrade_play if no_hitter_team == 'home' else game_details.away_pitcher_downgrade_play
-                        
-                        if game_status == 'downgrade':
-                            message = REG_DOWNGRADE.format(pitcher_name=pitcher_name, team_abbrv=team_abbrv, opposing_team=opposing_team)
-                        elif game_status == 'combined downgrade':
-                            message = COMBINED_DOWNGRADE.format(team_name=team_name, opposing_team=opposing_team)
                     
-                    status = build_status(message, game_details.home_team_abbrv, game_details.away_team_abbrv)
+                    if game_status == 'broken':
+                        message = REG_BROKEN.format(pitcher_name=pitcher_name, team_abbrv=team_abbrv, opposing_team=opposing_team) + ('\n\n' + broken_by_message if broken_by_message else '')
+                    elif game_status == 'combined broken':
+                        message = COMBINED_BROKEN.format(team_name=team_name, opposing_team=opposing_team) + ('\n\n' + broken_by_message if broken_by_message else '')
+                else: # downgrade
+                    downgrade_play_details = game_details.play_scanner.home_pitcher_downgrade_play if no_hitter_team == 'home' else game_details.play_scanner.away_pitcher_downgrade_play
                     
-                    try:
-                        if not is_debug_mode:
-                            twitter.update_status(status=status)
-                        live_team_ids_tweeted[team_id]['isPerfectGame'] = False
-                        if game_status in ['broken', 'combined broken']: # Only set game finished if broken; don't set finished for PG downgrades.
-                            live_team_ids_tweeted[team_id]['isFinished'] = True
-                            finished_team_ids_tweeted.append(team_id)
-                        logging.info('Tweet sent: ' + message + ' (Game ID: ' + str(game_details.game_id) + ')')
-                    except TwythonError as e:
-                        logging.exception('An error occurred and the Tweet was not sent: ' + str(e))
-            elif team_id not in live_team_ids_tweeted and not is_game_finished: # In-progress games that have a no-hitter/perfect game through 6 innings and haven't been tweeted yet.
+                    if game_status == 'downgrade':
+                        message = REG_DOWNGRADE.format(pitcher_name=pitcher_name, team_abbrv=team_abbrv, opposing_team=opposing_team)
+                    elif game_status == 'combined downgrade':
+                        message = COMBINED_DOWNGRADE.format(team_name=team_name, opposing_team=opposing_team)
+                
+                status = build_status(message, game_details.home_team_abbrv, game_details.away_team_abbrv)
+                
+                notify(game_details, team_id, 'broken' if game_status in ['broken', 'combined broken'] else 'downgrade', status, message)
+                live_team_ids_tweeted[team_key]['isPerfectGame'] = False
+                if game_status in ['broken', 'combined broken']: # Only set game finished if broken; don't set finished for PG downgrades.
+                    live_team_ids_tweeted[team_key]['isFinished'] = True
+                    finished_team_ids_tweeted.append(team_key)
+                save_tweeted_state(game_details, team_id)
+            elif team_key not in live_team_ids_tweeted and not is_game_finished: # In-progress games that have a no-hitter/perfect game through 6 innings and haven't been tweeted yet.
                 if game_status in ['no-hitter', 'perfect game']:
                     message = REG_CURRENT.format(pitcher_name=pitcher_name, team_abbrv=team_abbrv, game_status=game_status, opposing_team=opposing_team, innings_pitched=innings_pitched)
                 else: # combined no-hitter, combined perfect game
@@ -259,15 +547,11 @@ def send_no_hitter_tweet(game_details, no_hitter_team, game_status, is_game_fini
                 
                 status = build_status(message, game_details.home_team_abbrv, game_details.away_team_abbrv)
                 
-                try:
-                    if not is_debug_mode:
-                        twitter.update_status(status=status)
-                    isPerfectGame = game_status in ['perfect game', 'combined perfect game']
-                    live_team_ids_tweeted[team_id] = {'isPerfectGame': isPerfectGame, 'isFinished': False}
-                    logging.info('Tweet sent: ' + message + ' (Game ID: ' + str(game_details.game_id) + ')')
-                except TwythonError as e:
-                    logging.exception('An error occurred and the Tweet was not sent: ' + str(e))
-            elif is_game_finished and team_id not in finished_team_ids_tweeted: # Finished games that were a no-hitter/perfect game and haven't been tweeted yet.
+                notify(game_details, team_id, 'current', status, message)
+                isPerfectGame = game_status in ['perfect game', 'combined perfect game']
+                live_team_ids_tweeted[team_key] = {'isPerfectGame': isPerfectGame, 'isFinished': False}
+                save_tweeted_state(game_details, team_id)
+            elif is_game_finished and team_key not in finished_team_ids_tweeted: # Finished games that were a no-hitter/perfect game and haven't been tweeted yet.
                 if game_status in ['no-hitter', 'perfect game']:
                     message = REG_FINISHED.format(pitcher_name=pitcher_name, team_abbrv=team_abbrv, game_status=game_status, opposing_team=opposing_team)
                 else: # combined no-hitter, combined perfect game
@@ -275,14 +559,10 @@ def send_no_hitter_tweet(game_details, no_hitter_team, game_status, is_game_fini
                 
                 status = build_status(message, game_details.home_team_abbrv, game_details.away_team_abbrv)
                 
-                try:
-                    if not is_debug_mode:
-                        twitter.update_status(status=status)
-                    live_team_ids_tweeted[team_id]['isFinished'] = True
-                    finished_team_ids_tweeted.append(team_id)
-                    logging.info('Tweet sent: ' + message + ' (Game ID: ' + str(game_details.game_id) + ')')
-                except TwythonError as e:
-                    logging.exception('An error occurred and the Tweet was not sent: ' + str(e))
+                notify(game_details, team_id, 'finished', status, message)
+                live_team_ids_tweeted[team_key]['isFinished'] = True
+                finished_team_ids_tweeted.append(team_key)
+                save_tweeted_state(game_details, team_id)
     else:
         logging.error('An error occurred and the Tweet was not sent.')
 
@@ -300,52 +580,72 @@ if __name__ == '__main__':
             minute_interval_to_update = config_data['minute_interval_to_update']
             num_innings_to_alert = config_data['num_innings_to_alert']
             is_debug_mode = config_data['debug_mode']
+            max_concurrent_requests = config_data.get('max_concurrent_requests', 8)
+            request_timeout = config_data.get('request_timeout_seconds', 10)
+            max_retries = config_data.get('max_retries', 3)
+            prescreen_innings_margin = config_data.get('prescreen_innings_margin', 1.0)
+            hot_poll_seconds = config_data.get('hot_poll_seconds', 15)
+            idle_poll_minutes = config_data.get('idle_poll_minutes', 15)
+            daemon_mode = config_data.get('daemon_mode', True)
+            notification_max_attempts = config_data.get('notification_max_attempts', 5)
+            notifier_configs = config_data.get('notifiers', [{'type': 'twitter'}])
+            metrics_port = config_data.get('metrics_port', 9464)
+            profile_path = config_data.get('profile_path', '/home/scripts/NoHitterTracker/nohittertracker.prof')
+            state_db_path = config_data.get('state_db_path', '/home/scripts/NoHitterTracker/nohittertracker.db')
             logging.info('Config data successfully loaded.')
     except:
         # Defaults
         minute_interval_to_update = 3
         num_innings_to_alert = 6.0
         is_debug_mode = False
+        max_concurrent_requests = 8
+        request_timeout = 10
+        max_retries = 3
+        prescreen_innings_margin = 1.0
+        hot_poll_seconds = 15
+        idle_poll_minutes = 15
+        daemon_mode = True
+        notification_max_attempts = 5
+        notifier_configs = [{'type': 'twitter'}]
+        metrics_port = 9464
+        profile_path = '/home/scripts/NoHitterTracker/nohittertracker.prof'
+        state_db_path = '/home/scripts/NoHitterTracker/nohittertracker.db'
         logging.exception('Error loading config data.')
     
     logging.info('\n---CURRENT SETTINGS---')
     logging.info('Update interval: ' + str(minute_interval_to_update) + ' minutes')
     logging.info('Num innings needed to alert: ' + str(num_innings_to_alert) + ' innings')
     logging.info('Debug: ' + str(is_debug_mode))
-    twitter = Twython(CONSUMER_KEY, CONSUMER_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
-
-    game_details = []
-    current_date = datetime.date.today().strftime('%m/%d/%Y')
-
-    logging.info('\nDate: ' + current_date)
+    logging.info('Max concurrent requests: ' + str(max_concurrent_requests))
+    logging.info('Request timeout: ' + str(request_timeout) + ' seconds')
+    logging.info('Max retries: ' + str(max_retries))
+    logging.info('Pre-screen margin: ' + str(prescreen_innings_margin) + ' innings')
+    logging.info('Hot game update interval: ' + str(hot_poll_seconds) + ' seconds')
+    logging.info('Idle update interval: ' + str(idle_poll_minutes) + ' minutes')
+    logging.info('State database: ' + state_db_path)
+    logging.info('Daemon mode: ' + str(daemon_mode))
+    logging.info('Notification max attempts: ' + str(notification_max_attempts))
+    logging.info('Metrics port: ' + str(metrics_port))
+    logging.info('Profile path: ' + profile_path)
+    twitter_timeout = next((notifier_config.get('timeout_seconds', 10) for notifier_config in notifier_configs if notifier_config.get('type') == 'twitter'), 10)
+    twitter = Twython(CONSUMER_KEY, CONSUMER_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET, client_args={'timeout': twitter_timeout})
+    mlb_api.init_session(pool_size=max_concurrent_requests, timeout=request_timeout, max_retries=max_retries)
+    poll_executor = ThreadPoolExecutor(max_workers=max_concurrent_requests)
+    state_store.open_store(state_db_path)
+    sinks = build_sinks(notifier_configs, twitter)
+    logging.info('Notifiers: ' + ', '.join(sink.name for sink in sinks))
+    notifier = Notifier(sinks, is_debug_mode=is_debug_mode, max_attempts=notification_max_attempts)
+    notifier.start()
+    if metrics_port:
+        metrics.start_server(metrics_port)
+    metrics.enable_profiling_signal(profile_path)
+
+    current_date = datetime.date.today()
+    if daemon_mode: # Also track yesterday's games in case late games are still in progress after a restart past midnight.
+        tracked_dates.append((current_date - datetime.timedelta(days=1)).strftime('%m/%d/%Y'))
+    else:
+        tracked_dates.append(current_date.strftime('%m/%d/%Y'))
+        logging.info('\nDate: ' + tracked_dates[0])
     logging.info('SCANNING GAMES...\n')
 
-    game_details = []
-    game_ids = get_game_ids_by_date(current_date)
-
-    for key, value in game_ids.items():
-        game_details.append(GameDetails(key))
-
-    while True:
-        for game in game_details:
-            game.game_status = game_ids[game.game_id]
-            live_no_hitter_tweeted = game.home_team_id in live_team_ids_tweeted or game.away_team_id in live_team_ids_tweeted
-            finished_no_hitter_tweeted = game.home_team_id in finished_team_ids_tweeted or game.away_team_id in finished_team_ids_tweeted
-            
-            if game.game_status == 'I' or (game.game_status == 'F' and live_no_hitter_tweeted and not(finished_no_hitter_tweeted)):
-                game.set_live_game_details()
-
-                home_no_hitter_status = check_no_hitter(game.home_team_id, game.home_pitching_details, game.num_home_pitchers)
-                logging.debug('main:: game_id: ' + str(game.game_id) + ', home_no_hitter_status: ' + home_no_hitter_status + ', home_team_id: ' + str(game.home_team_id) + ', num_home_pitchers: ' + str(game.num_home_pitchers))
-                if home_no_hitter_status != 'none':
-                    is_final = game.game_status == 'F' # status code 'F' indicates the game is Final
-                    send_no_hitter_tweet(game, 'home', home_no_hitter_status, is_final)
-
-                away_no_hitter_status = check_no_hitter(game.away_team_id, game.away_pitching_details, game.num_away_pitchers)
-                logging.debug('main:: game_id: ' + str(game.game_id) + ', away_no_hitter_status: ' + away_no_hitter_status + ', away_team_id: ' + str(game.away_team_id) + ', num_away_pitchers: ' + str(game.num_away_pitchers))
-                if away_no_hitter_status != 'none':
-                    is_final = game.game_status == 'F' # status code 'F' indicates the game is Final
-                    send_no_hitter_tweet(game, 'away', away_no_hitter_status, is_final)
-
-        time.sleep(minute_interval_to_update * 60)
-        game_ids = get_game_ids_by_date(current_date) # Contains { id: game_status } mapping. This should be called every time the loop runs so the game status' are updated.
+    run_poll_loop()
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+# No-Hitter Tracker
+#   In-process metrics for the poll loop (request latency and bytes, JSON parse time, cycle duration and lag, games polled, notification queue depth and lag per sink),
+#   served in the Prometheus text format on a local HTTP endpoint. Sending SIGUSR1 starts a cProfile run of the poll loop; sending it again dumps the stats.
+
+import logging
+import threading
+import signal
+import cProfile
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+metric_families = {} # {name: {'type': type, 'help': help, 'buckets': buckets, 'samples': {labels: value}}}
+metrics_lock = threading.Lock()
+
+profiler = None
+profile_path = ''
+
+
+def get_sample_labels(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def get_metric_family(name, metric_type, help_text, buckets=None):
+    metric_family = metric_families.get(name)
+    if metric_family is None:
+        metric_family = {'type': metric_type, 'help': help_text, 'buckets': buckets, 'samples': {}}
+        metric_families[name] = metric_family
+    return metric_family
+
+
+def inc_counter(name, help_text, value=1, labels=None):
+    with metrics_lock:
+        samples = get_metric_family(name, 'counter', help_text)['samples']
+        sample_labels = get_sample_labels(labels)
+        samples[sample_labels] = samples.get(sample_labels, 0) + value
+
+
+def set_gauge(name, help_text, value, labels=None):
+    with metrics_lock:
+        get_metric_family(name, 'gauge', help_text)['samples'][get_sample_labels(labels)] = value
+
+
+def observe(name, help_text, value, labels=None, buckets=DEFAULT_BUCKETS):
+    with metrics_lock:
+        metric_family = get_metric_family(name, 'histogram', help_text, buckets)
+        sample_labels = get_sample_labels(labels)
+        histogram = metric_family['samples'].get(sample_labels)
+        if histogram is None:
+            histogram = {'bucket_counts': [0] * len(metric_family['buckets']), 'sum': 0, 'count': 0}
+            metric_family['samples'][sample_labels] = histogram
+
+        for index, bucket in enumerate(metric_family['buckets']):
+            if value <= bucket:
+                histogram['bucket_counts'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def format_labels(sample_labels, extra_labels=()):
+    all_labels = list(sample_labels) + list(extra_labels)
+    if not all_labels:
+        return ''
+    return '{' + ','.join(key + '="' + str(value).replace('"', '\\"') + '"' for key, value in all_labels) + '}'
+
+
+def render(): # Returns every metric in the Prometheus text exposition format.
+    lines = []
+    with metrics_lock:
+        for name, metric_family in sorted(metric_families.items()):
+            lines.append('# HELP ' + name + ' ' + metric_family['help'])
+            lines.append('# TYPE ' + name + ' ' + metric_family['type'])
+            for sample_labels, value in sorted(metric_family['samples'].items()):
+                if metric_family['type'] != 'histogram':
+                    lines.append(name + format_labels(sample_labels) + ' ' + str(value))
+                    continue
+                for bucket, bucket_count in zip(metric_family['buckets'], value['bucket_counts']):
+                    lines.append(name + '_bucket' + format_labels(sample_labels, [('le', bucket)]) + ' ' + str(bucket_count))
+                lines.append(name + '_bucket' + format_labels(sample_labels, [('le', '+Inf')]) + ' ' + str(value['count']))
+                lines.append(name + '_sum' + format_labels(sample_labels) + ' ' + str(value['sum']))
+                lines.append(name + '_count' + format_labels(sample_labels) + ' ' + str(value['count']))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        content = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port, host='127.0.0.1'): # Serves the metrics at http://host:port/metrics from a background thread.
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    except OSError as e:
+        logging.exception('An error occurred and the metrics endpoint was not started: ' + str(e))
+        return None
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info('Metrics endpoint: http://' + host + ':' + str(server.server_address[1]) + '/metrics')
+    return server
+
+
+def toggle_profiler(signum, frame): # The profile covers the poll loop in the main thread, where the signal is handled.
+    global profiler
+    if profiler is None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        logging.info('Profiling started.')
+    else:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        profiler = None
+        logging.info('Profiling stopped, stats written to: ' + profile_path)
+
+
+def enable_profiling_signal(path, signum=signal.SIGUSR1):
+    global profile_path
+    profile_path = path
+    signal.signal(signum, toggle_profiler)
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+# No-Hitter Tracker
+#   Shared HTTP client for all statsapi requests. Requests go through a single pooled session so connections are kept alive between updates,
+#   responses are gzip compressed, failed requests are retried with backoff, and unchanged responses (304 Not Modified, or the same body again)
+#   return NOT_MODIFIED so callers can skip parsing and processing them. Only the validators and a digest of each response are kept, never the body.
+
+import logging
+import threading
+import time
+import json
+import re
+import hashlib
+import requests
+from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import metrics
+
+try:
+    import orjson # Optional; decodes large live feeds several times faster than json.
+except ImportError:
+    orjson = None
+
+BASE_URL = 'http://statsapi.mlb.com/api'
+
+request_timeout = 10 # Seconds to wait on a single request before giving up on it.
+session = None
+session_lock = threading.Lock()
+
+NOT_MODIFIED = object() # Returned instead of the body when the response hasn't changed since the last request.
+
+response_cache = {} # {cache_key: {'etag': etag, 'last_modified': last_modified, 'digest': digest}}
+response_cache_lock = threading.Lock()
+
+
+def init_session(pool_size=10, timeout=10, max_retries=3, backoff_factor=0.5):
+    global session, request_timeout
+    request_timeout = timeout
+
+    retry = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    new_session = requests.Session()
+    new_session.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+    new_session.mount('http://', adapter)
+    new_session.mount('https://', adapter)
+    session = new_session
+    return session
+
+
+def get_session():
+    with session_lock:
+        if session is None:
+            init_session()
+    return session
+
+
+def get_endpoint_name(path): # Replaces ids in the path so every game's feed is reported under one endpoint, ex: /v1.1/game/{id}/feed/live
+    return re.sub(r'/\d+(?=/|$)', '/{id}', path)
+
+
+def build_cache_key(path, params):
+    return path + '?' + urlencode(sorted(params.items())) if params else path
+
+
+def get_content(path, params=None): # Returns the raw response body for the statsapi path, NOT_MODIFIED if it's unchanged since the last request, or None if the request failed.
+    cache_key = build_cache_key(path, params)
+    headers = {}
+
+    with response_cache_lock:
+        cached_response = response_cache.get(cache_key)
+    if cached_response is not None:
+        if cached_response['etag']:
+            headers['If-None-Match'] = cached_response['etag']
+        if cached_response['last_modified']:
+            headers['If-Modified-Since'] = cached_response['last_modified']
+
+    endpoint_name = get_endpoint_name(path)
+    start_time = time.perf_counter()
+    try:
+        response = get_session().get(BASE_URL + path, params=params, headers=headers, timeout=request_timeout)
+        metrics.observe('nohitter_request_seconds', 'statsapi request latency.', time.perf_counter() - start_time, {'endpoint': endpoint_name})
+        metrics.inc_counter('nohitter_requests_total', 'statsapi requests by response status.', labels={'endpoint': endpoint_name, 'status': response.status_code})
+        metrics.inc_counter('nohitter_request_bytes_total', 'statsapi response bytes downloaded (after decompression).', len(response.content), {'endpoint': endpoint_name})
+        if response.status_code == 304 and cached_response is not None:
+            return NOT_MODIFIED
+        if response.status_code == 200:
+            digest = hashlib.sha1(response.content).digest() # Catches unchanged bodies from servers that don't send validators.
+            with response_cache_lock:
+                response_cache[cache_key] = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'), 'digest': digest}
+            if cached_response is not None and cached_response['digest'] == digest:
+                return NOT_MODIFIED
+            return response.content
+        logging.warning('get_content:: path: ' + path + ', status_code: ' + str(response.status_code))
+    except requests.exceptions.RequestException as e:
+        metrics.inc_counter('nohitter_requests_total', 'statsapi requests by response status.', labels={'endpoint': endpoint_name, 'status': 'error'})
+        logging.exception(e)
+    except ConnectionError as e:
+        metrics.inc_counter('nohitter_requests_total', 'statsapi requests by response status.', labels={'endpoint': endpoint_name, 'status': 'error'})
+        logging.exception(e)
+    return None
+
+
+def get_json(path, params=None): # Returns the parsed response for the statsapi path, NOT_MODIFIED if it's unchanged since the last request, or None if the request failed.
+    content = get_content(path, params)
+    if content is None or content is NOT_MODIFIED:
+        return content
+
+    start_time = time.perf_counter()
+    try:
+        return orjson.loads(content) if orjson is not None else json.loads(content)
+    except ValueError as e: # orjson.JSONDecodeError is a ValueError too.
+        logging.exception(e)
+    finally:
+        metrics.observe('nohitter_json_parse_seconds', 'Time spent decoding statsapi responses.', time.perf_counter() - start_time, {'endpoint': get_endpoint_name(path)})
+        metrics.inc_counter('nohitter_json_parsed_bytes_total', 'statsapi response bytes decoded.', len(content), {'endpoint': get_endpoint_name(path)})
+    return None
+
+
+def forget(path, params=None): # Drops the cached responses for a path that won't be requested again, whatever parameters they were requested with unless params is given.
+    with response_cache_lock:
+        if params is not None:
+            response_cache.pop(build_cache_key(path, params), None)
+            return
+        for cache_key in [cache_key for cache_key in response_cache if cache_key == path or cache_key.startswith(path + '?')]:
+            del response_cache[cache_key]
+
+
+def clear_cache():
+    with response_cache_lock:
+        response_cache.clear()
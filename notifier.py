@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+
+# No-Hitter Tracker
+#   Outbound notifications. Each event is rendered once and fanned out to every configured sink (Twitter, a webhook such as Discord, or a file/stdout).
+#   Every sink has its own background worker, timeout and retries, so a slow or failing sink never delays the detection loop or the other sinks.
+#   Every notification is saved to the state store before it is queued and marked sent afterwards, so the same (game_id, team_id, event) is never
+#   sent twice to a sink and any notification still pending when the service stops is sent after the next restart.
+
+import sys
+import logging
+import threading
+import datetime
+import time
+import queue
+import itertools
+import requests
+from twython import TwythonError, TwythonRateLimitError
+import state_store
+import metrics
+
+PERMANENT_ERROR_CODES = [400, 401, 403, 404] # Bad request, bad credentials, duplicate/forbidden status, unknown webhook; retrying won't help.
+
+
+class NotificationError(Exception): # retry_after is in seconds from now.
+    def __init__(self, message, retry_after=None, is_permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.is_permanent = is_permanent
+
+
+class Sink:
+    is_sent_in_debug_mode = False # Debug mode only sends to sinks that don't publish anything.
+
+    def __init__(self, name, timeout=10):
+        self.name = name
+        self.timeout = timeout
+
+    def send(self, text): # Raises NotificationError if the notification was not sent.
+        raise NotImplementedError
+
+    def wait_for_rate_limit(self):
+        pass
+
+
+class TwitterSink(Sink): # The Twython client's timeout is set with client_args when it is created.
+    def __init__(self, twitter, name='twitter', timeout=10):
+        super().__init__(name, timeout)
+        self.twitter = twitter
+
+    def send(self, text):
+        try:
+            self.twitter.update_status(status=text)
+        except TwythonRateLimitError as e: # Twython sets retry_after from the x-rate-limit-reset header, which is an epoch timestamp.
+            raise NotificationError(str(e), retry_after=max(float(e.retry_after) - time.time(), 0) if e.retry_after else None)
+        except TwythonError as e:
+            raise NotificationError(str(e), is_permanent=e.error_code in PERMANENT_ERROR_CODES)
+
+    def wait_for_rate_limit(self): # Waits for the rate limit window to reset once the last call used up the remaining requests.
+        try:
+            remaining = self.twitter.get_lastfunction_header('x-rate-limit-remaining')
+            reset = self.twitter.get_lastfunction_header('x-rate-limit-reset')
+        except TwythonError:
+            return
+        if remaining is not None and reset is not None and int(remaining) == 0:
+            delay = max(int(reset) - time.time(), 0)
+            logging.warning('Rate limit reached, waiting ' + str(int(delay)) + ' seconds before sending the next Tweet.')
+            time.sleep(delay)
+
+
+class WebhookSink(Sink): # Posts {payload_key: text} as JSON; 'content' works for Discord and 'text' for Slack.
+    def __init__(self, url, name='webhook', timeout=10, payload_key='content'):
+        super().__init__(name, timeout)
+        self.url = url
+        self.payload_key = payload_key
+
+    def send(self, text):
+        try:
+            response = requests.post(self.url, json={self.payload_key: text}, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise NotificationError(str(e))
+
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After')
+            raise NotificationError('Webhook rate limited', retry_after=float(retry_after) if retry_after else None)
+        if response.status_code >= 400:
+            raise NotificationError('Webhook returned a ' + str(response.status_code), is_permanent=response.status_code in PERMANENT_ERROR_CODES)
+
+
+class FileSink(Sink): # Appends each notification to a file, or writes it to stdout if the path is '-'. Useful for testing.
+    is_sent_in_debug_mode = True
+
+    def __init__(self, path, name='file', timeout=10):
+        super().__init__(name, timeout)
+        self.path = path
+
+    def send(self, text):
+        line = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S') + ' | ' + text.replace('\n', ' ') + '\n'
+        try:
+            if self.path == '-':
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                with open(self.path, 'a') as file:
+                    file.write(line)
+        except OSError as e:
+            raise NotificationError(str(e))
+
+
+class SinkQueue: # Sends the notifications for one sink from its own background worker.
+    def __init__(self, sink, is_debug_mode=False, max_attempts=5, backoff_seconds=5, max_backoff_seconds=300, max_requeue_seconds=3600):
+        self.sink = sink
+        self.is_debug_mode = is_debug_mode
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_requeue_seconds = max_requeue_seconds
+        self.pending = queue.Queue() # (key, text, queued_at, num_requeues)
+        self.queued_keys = set()
+        self.queued_keys_lock = threading.Lock()
+        self.worker = threading.Thread(target=self.run, name='notifier_' + sink.name, daemon=True)
+
+    def start(self): # Re-queues the notifications that were still pending when the service stopped, then starts the worker.
+        for key, text in state_store.load_pending_notifications(self.sink.name):
+            with self.queued_keys_lock:
+                self.queued_keys.add(key)
+            self.pending.put((key, text, time.time(), 0))
+            logging.info('Pending notification restored: ' + self.sink.name + ' ' + key)
+        self.worker.start()
+
+    def put(self, key, text): # Returns False if a notification with the same key has already been queued or sent to this sink.
+        with self.queued_keys_lock:
+            if key in self.queued_keys:
+                return False
+            self.queued_keys.add(key)
+
+        if not state_store.save_pending_notification(self.sink.name, key, text):
+            return False
+        self.pending.put((key, text, time.time(), 0))
+        metrics.set_gauge('nohitter_notification_queue_depth', 'Notifications waiting to be sent.', self.pending.qsize(), {'sink': self.sink.name})
+        return True
+
+    def run(self):
+        while True:
+            key, text, queued_at, num_requeues = self.pending.get()
+            try:
+                result = self.send(key, text)
+                metrics.inc_counter('nohitter_notifications_total', 'Notifications handled by each sink.', labels={'sink': self.sink.name, 'result': result})
+                if result == 'sent':
+                    metrics.observe('nohitter_notification_queue_lag_seconds', 'Time from queueing a notification to sending it.', time.time() - queued_at, {'sink': self.sink.name})
+                elif result == 'retrying':
+                    self.requeue(key, text, queued_at, num_requeues)
+            except Exception as e: # A bug in one sink must not stop its worker.
+                logging.exception('An error occurred in the ' + self.sink.name + ' notifier: ' + str(e))
+            finally:
+                metrics.set_gauge('nohitter_notification_queue_depth', 'Notifications waiting to be sent.', self.pending.qsize(), {'sink': self.sink.name})
+                self.pending.task_done()
+
+    def requeue(self, key, text, queued_at, num_requeues): # Puts a notification that used up its attempts back on the queue later, so an outage doesn't need a restart to recover.
+        delay = min(self.max_backoff_seconds * 2 ** num_requeues, self.max_requeue_seconds)
+        logging.error('The notification was not sent after ' + str(self.max_attempts) + ' attempts and will be retried in ' + str(delay) + ' seconds: ' + self.sink.name + ' (Key: ' + key + ')')
+        timer = threading.Timer(delay, self.pending.put, args=((key, text, queued_at, num_requeues + 1),))
+        timer.daemon = True
+        timer.start()
+
+    def send(self, key, text): # Returns 'sent', 'failed' if the notification will never be sent, or 'retrying' if it should be retried later.
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if not self.is_debug_mode or self.sink.is_sent_in_debug_mode:
+                    self.sink.send(text)
+                state_store.mark_notification_sent(self.sink.name, key)
+                logging.info('Notification sent: ' + self.sink.name + ' ' + text.replace('\n', ' ') + ' (Key: ' + key + ')')
+                if not self.is_debug_mode:
+                    self.sink.wait_for_rate_limit()
+                return 'sent'
+            except NotificationError as e:
+                if e.is_permanent:
+                    state_store.mark_notification_sent(self.sink.name, key)
+                    logging.error('An error occurred and the notification will not be retried: ' + self.sink.name + ' ' + str(e) + ' (Key: ' + key + ')')
+                    return 'failed'
+                delay = min(e.retry_after if e.retry_after is not None else self.backoff_seconds * 2 ** (attempt - 1), self.max_backoff_seconds)
+                if attempt == self.max_attempts:
+                    break
+                logging.warning('An error occurred and the notification was not sent, retrying in ' + str(delay) + ' seconds: ' + self.sink.name + ' ' + str(e) + ' (Key: ' + key + ')')
+            time.sleep(delay)
+        return 'retrying'
+
+
+class Notifier: # Fans each rendered notification out to the queue of every sink.
+    def __init__(self, sinks, is_debug_mode=False, max_attempts=5):
+        self.sink_queues = [SinkQueue(sink, is_debug_mode, max_attempts) for sink in sinks]
+
+    def start(self):
+        for sink_queue in self.sink_queues:
+            sink_queue.start()
+
+    def put(self, key, text): # Returns True if the notification was queued for at least one sink.
+        is_queued = False
+        for sink_queue in self.sink_queues:
+            is_queued = sink_queue.put(key, text) or is_queued
+        return is_queued
+
+    def join(self): # Blocks until every queued notification has been handled by every sink.
+        for sink_queue in self.sink_queues:
+            sink_queue.pending.join()
+
+
+def build_sinks(notifier_configs, twitter): # Builds the sinks from the 'notifiers' config list, ex: [{"type": "webhook", "url": "...", "timeout_seconds": 5}]
+    sinks = []
+    names = set()
+    for notifier_config in notifier_configs:
+        sink_type = notifier_config.get('type')
+        name = notifier_config.get('name', sink_type)
+        if name in names: # Pending notifications are saved by sink name, so two sinks must never share one.
+            name = next(name + '_' + str(suffix) for suffix in itertools.count(2) if name + '_' + str(suffix) not in names)
+            logging.warning('Duplicate notifier name, renamed to ' + name + '. Give each notifier a unique name so it keeps its pending notifications if the config is reordered.')
+        names.add(name)
+        timeout = notifier_config.get('timeout_seconds', 10)
+
+        if sink_type == 'twitter':
+            sinks.append(TwitterSink(twitter, name, timeout))
+        elif sink_type == 'webhook':
+            sinks.append(WebhookSink(notifier_config['url'], name, timeout, notifier_config.get('payload_key', 'content')))
+        elif sink_type == 'file':
+            sinks.append(FileSink(notifier_config.get('path', '-'), name, timeout))
+        else:
+            logging.error('Unknown notifier type: ' + str(sink_type))
+    return sinks
@@ -0,0 +1,376 @@
+#!/usr/bin/python3
+
+# No-Hitter Tracker
+#   Records statsapi schedule, live feed and people snapshots to disk, and replays them through the main loop offline.
+#   Replays run against a local stub HTTP server with a fake Twython and a virtual clock, so a full day of games replays in seconds.
+#
+#   python3 replay.py record <recording_dir> [--date MM/DD/YYYY] [--interval SECONDS]
+#   python3 replay.py replay <recording_dir> [--config CONFIG_PATH]
+#   python3 replay.py bench <recording_dir> [--config CONFIG_PATH]
+
+import os
+import sys
+import gzip
+import json
+import time
+import bisect
+import hashlib
+import logging
+import argparse
+import datetime
+import threading
+from urllib.parse import urlsplit, parse_qsl
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+import mlb_api
+import main
+from notifier import Notifier, TwitterSink
+
+INDEX_FILENAME = 'index.jsonl'
+PEOPLE_PATH = '/v1/people'
+REPLAY_END_MARGIN_SECONDS = 15 * 60 # Keep replaying this long after the last snapshot so final games get their follow-up tweets.
+
+CONFIG_ATTRIBUTES = {
+    'minute_interval_to_update': 'minute_interval_to_update',
+    'num_innings_to_alert': 'num_innings_to_alert',
+    'prescreen_innings_margin': 'prescreen_innings_margin',
+    'hot_poll_seconds': 'hot_poll_seconds',
+    'idle_poll_minutes': 'idle_poll_minutes',
+} # {config key: main attribute}
+
+
+class ReplayFinished(Exception):
+    pass
+
+
+class FakeTwython:
+    def __init__(self):
+        self.statuses = []
+
+    def update_status(self, status):
+        self.statuses.append((replay_clock.time(), status))
+
+    def get_lastfunction_header(self, header):
+        return None
+
+
+class ReplayClock: # Stands in for the time module in main so sleeps advance a virtual clock instantly.
+    def __init__(self):
+        self.current_time = 0
+        self.end_time = 0
+        self.cycle_stats = []
+        self.cycle_start = None
+
+    def time(self):
+        return self.current_time
+
+    def sleep(self, seconds):
+        self.end_cycle()
+        self.current_time += seconds
+        if self.current_time > self.end_time:
+            raise ReplayFinished()
+        self.start_cycle()
+
+    def start_cycle(self):
+        self.cycle_start = (time.perf_counter(), time.process_time(), replay_stats['bytes_parsed'], replay_stats['requests'])
+
+    def end_cycle(self):
+        if self.cycle_start is None:
+            return
+        wall_start, cpu_start, bytes_start, requests_start = self.cycle_start
+        self.cycle_stats.append({
+            'latency': time.perf_counter() - wall_start,
+            'cpu_time': time.process_time() - cpu_start,
+            'bytes_parsed': replay_stats['bytes_parsed'] - bytes_start,
+            'requests': replay_stats['requests'] - requests_start,
+        })
+        self.cycle_start = None
+
+
+replay_clock = ReplayClock()
+replay_stats = {'bytes_parsed': 0, 'requests': 0}
+replay_stats_lock = threading.Lock()
+
+
+def filter_fields(value, fields): # Keeps only the keys named in fields at any depth, the same way the statsapi fields parameter does.
+    if isinstance(value, dict):
+        return {key: filter_fields(item, fields) for key, item in value.items() if key in fields}
+    if isinstance(value, list):
+        return [filter_fields(item, fields) for item in value]
+    return value
+
+
+class Recording:
+    def __init__(self, recording_dir):
+        self.recording_dir = recording_dir
+        self.snapshots = {} # {cache_key: [(time, filename, etag)]} sorted by time
+        self.snapshot_times = {} # {cache_key: [time]} matching self.snapshots, for bisecting
+        self.dates = {} # {date: (first_time, last_time)}
+        self.player_names = {} # {player_id: full_name} from every recorded people lookup
+        self.filtered_snapshots = {} # {(filename, fields): content}
+        self.filtered_snapshots_lock = threading.Lock()
+
+        with open(os.path.join(recording_dir, INDEX_FILENAME), 'r') as file:
+            for line in file:
+                entry = json.loads(line)
+                self.snapshots.setdefault(entry['key'], []).append((entry['time'], entry['file'], entry['etag']))
+                first_time, last_time = self.dates.get(entry['date'], (entry['time'], entry['time']))
+                self.dates[entry['date']] = (min(first_time, entry['time']), max(last_time, entry['time']))
+        for cache_key, key_snapshots in self.snapshots.items():
+            key_snapshots.sort()
+            self.snapshot_times[cache_key] = [snapshot[0] for snapshot in key_snapshots]
+            if cache_key.split('?')[0] == PEOPLE_PATH:
+                for snapshot_time, filename, etag in key_snapshots:
+                    for player_details in json.loads(self.read_snapshot(filename)).get('people', []):
+                        self.player_names[player_details['id']] = player_details['fullName']
+
+    def get_snapshot(self, cache_key, at_time): # Returns the (filename, etag) of the latest snapshot taken at or before at_time.
+        key_snapshots = self.snapshots.get(cache_key)
+        if not key_snapshots:
+            return None
+        index = bisect.bisect_right(self.snapshot_times[cache_key], at_time) - 1
+        snapshot_time, filename, etag = key_snapshots[max(index, 0)]
+        return filename, etag
+
+    def read_snapshot(self, filename):
+        with gzip.open(os.path.join(self.recording_dir, filename), 'rb') as file:
+            return file.read()
+
+    def read_filtered_snapshot(self, filename, fields): # Filtered snapshots are kept so bench cycles don't pay for filtering the same snapshot again.
+        with self.filtered_snapshots_lock:
+            content = self.filtered_snapshots.get((filename, fields))
+        if content is None:
+            content = json.dumps(filter_fields(json.loads(self.read_snapshot(filename)), set(fields.split(',')))).encode('utf-8')
+            with self.filtered_snapshots_lock:
+                self.filtered_snapshots[(filename, fields)] = content
+        return content
+
+
+class StubRequestHandler(BaseHTTPRequestHandler): # Serves recorded snapshots in place of statsapi, including 304 responses for conditional requests.
+    recording = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path[len('/api'):] if url.path.startswith('/api') else url.path
+        params = dict(parse_qsl(url.query))
+        if path == PEOPLE_PATH: # The players main looks up depend on its name cache, so lookups are answered from every recorded name instead of by exact key.
+            self.send_people(params.get('personIds', ''))
+            return
+
+        fields = None
+        snapshot = self.recording.get_snapshot(mlb_api.build_cache_key(path, params), replay_clock.time())
+        if snapshot is None: # Responses are recorded in full, so requests for a subset of the fields are filtered like statsapi would.
+            fields = params.pop('fields', None)
+            snapshot = self.recording.get_snapshot(mlb_api.build_cache_key(path, params), replay_clock.time())
+
+        if snapshot is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        filename, etag = snapshot
+        if fields is not None:
+            etag = '"' + hashlib.sha1((etag + fields).encode('utf-8')).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        content = self.recording.read_snapshot(filename) if fields is None else self.recording.read_filtered_snapshot(filename, fields)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_people(self, person_ids):
+        people = [{'id': int(player_id), 'fullName': self.recording.player_names[int(player_id)]} for player_id in person_ids.split(',') if player_id.isdigit() and int(player_id) in self.recording.player_names]
+        content = json.dumps({'people': people}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def get_missing_pitcher_ids(feed): # Returns the ids of the starting pitchers whose names are missing from the feed, which main looks up with /v1/people.
+    players = feed['gameData'].get('players', {})
+    pitcher_ids = [team_boxscore['pitchers'][0] for team_boxscore in feed['liveData']['boxscore']['teams'].values() if team_boxscore['pitchers']]
+    return [pitcher_id for pitcher_id in pitcher_ids if 'ID' + str(pitcher_id) not in players]
+
+
+def record(recording_dir, date, interval_seconds): # Saves the schedule and the live feed of every in-progress game until all games on the date are over.
+    # Each game's feed is saved once more after it leaves 'I', so the final feed (complete inningsPitched, status 'F') is part of the recording.
+    os.makedirs(recording_dir, exist_ok=True)
+    last_etags = {} # {cache_key: etag} so unchanged responses are only saved once.
+    index_lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=8)
+    previous_in_progress_game_ids = set()
+    recorded_player_ids = set()
+
+    def save_response(index_file, path, params=None):
+        mlb_api.forget(path, params or {}) # Every response is parsed here, so never make a conditional request.
+        content = mlb_api.get_content(path, params)
+        if content is None:
+            return None
+
+        cache_key = mlb_api.build_cache_key(path, params)
+        etag = '"' + hashlib.sha1(content).hexdigest() + '"'
+        if last_etags.get(cache_key) != etag:
+            last_etags[cache_key] = etag
+            filename = etag.strip('"') + '.json.gz'
+            with gzip.open(os.path.join(recording_dir, filename), 'wb') as file:
+                file.write(content)
+            with index_lock:
+                index_file.write(json.dumps({'time': time.time(), 'date': date, 'key': cache_key, 'file': filename, 'etag': etag}) + '\n')
+                index_file.flush()
+        return json.loads(content)
+
+    with open(os.path.join(recording_dir, INDEX_FILENAME), 'a') as index_file:
+        while True:
+            schedule = save_response(index_file, '/v1/schedule/games/', {'sportId': 1, 'date': date, 'hydrate': 'linescore'})
+            games = schedule['dates'][0]['games'] if schedule is not None and schedule['dates'] else []
+            live_game_ids = [game['gamePk'] for game in games if game['status']['codedGameState'] not in main.FINAL_STATUS_CODES]
+
+            in_progress_game_ids = {game['gamePk'] for game in games if game['status']['codedGameState'] == 'I'}
+
+            feeds = executor.map(lambda game_id: save_response(index_file, '/v1.1/game/' + str(game_id) + '/feed/live'), sorted(in_progress_game_ids | previous_in_progress_game_ids))
+            previous_in_progress_game_ids = in_progress_game_ids
+            missing_player_ids = {pitcher_id for feed in feeds if feed is not None for pitcher_id in get_missing_pitcher_ids(feed)} - recorded_player_ids
+            if missing_player_ids:
+                save_response(index_file, PEOPLE_PATH, {'personIds': ','.join(str(player_id) for player_id in sorted(missing_player_ids)), 'fields': 'people,id,fullName'})
+                recorded_player_ids.update(missing_player_ids)
+            logging.info('record:: date: ' + date + ', games: ' + str(len(games)) + ', live games: ' + str(len(live_game_ids)))
+
+            if schedule is not None and not live_game_ids:
+                break
+            time.sleep(interval_seconds)
+
+
+def reset_tracker(): # Clears the state main keeps between dates.
+    main.tracked_games.clear()
+    main.tracked_dates.clear()
+    main.game_linescores.clear()
+    main.live_team_ids_tweeted.clear()
+    main.finished_team_ids_tweeted.clear()
+    main.previous_game_ids = {}
+    mlb_api.clear_cache()
+
+
+def count_content(get_content): # Wraps mlb_api.get_content to count the requests made and the bytes handed to the JSON parser.
+    def counted_get_content(path, params=None):
+        content = get_content(path, params)
+        with replay_stats_lock:
+            replay_stats['requests'] += 1
+            replay_stats['bytes_parsed'] += len(content) if isinstance(content, bytes) else 0
+        return content
+    return counted_get_content
+
+
+def replay(recording_dir, config_data, print_tweets=True): # Replays every recorded date through main.run_poll_loop and returns {date: [cycle stats]}.
+    recording = Recording(recording_dir)
+    StubRequestHandler.recording = recording
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    mlb_api.BASE_URL = 'http://127.0.0.1:' + str(server.server_address[1]) + '/api'
+    mlb_api.init_session(max_retries=0)
+    mlb_api.get_content = count_content(mlb_api.get_content)
+
+    main.num_innings_to_alert = 6.0
+    for config_key, attribute in CONFIG_ATTRIBUTES.items():
+        if config_key in config_data:
+            setattr(main, attribute, config_data[config_key])
+    main.is_debug_mode = False
+    main.daemon_mode = False
+    main.twitter = FakeTwython()
+    main.notifier = Notifier([TwitterSink(main.twitter)])
+    main.notifier.start()
+    main.time = replay_clock
+    main.poll_executor = ThreadPoolExecutor(max_workers=config_data.get('max_concurrent_requests', 8))
+
+    date_stats = {}
+    for date, (first_time, last_time) in sorted(recording.dates.items(), key=lambda item: item[1][0]):
+        reset_tracker()
+        main.tracked_dates.append(date)
+        replay_clock.current_time = first_time
+        replay_clock.end_time = last_time + REPLAY_END_MARGIN_SECONDS
+        replay_clock.cycle_stats = []
+        replay_clock.start_cycle()
+        num_statuses = len(main.twitter.statuses)
+
+        try:
+            main.run_poll_loop()
+        except ReplayFinished:
+            pass
+        main.notifier.join()
+
+        date_stats[date] = replay_clock.cycle_stats
+        for status_time, status in main.twitter.statuses[num_statuses:] if print_tweets else []:
+            print(date + ' ' + datetime.datetime.fromtimestamp(status_time).strftime('%H:%M:%S') + ' | ' + status.replace('\n', ' '))
+
+    server.shutdown()
+    return date_stats
+
+
+def get_percentile(values, percentile):
+    if not values:
+        return 0
+    sorted_values = sorted(values)
+    return sorted_values[min(int(len(sorted_values) * percentile / 100), len(sorted_values) - 1)]
+
+
+def print_benchmark(date_stats):
+    BENCHMARK_ROW = '{0:<12} {1:>7} {2:>9} {3:>10} {4:>10} {5:>10} {6:>13} {7:>10}'
+    print(BENCHMARK_ROW.format('date', 'cycles', 'requests', 'p50 ms', 'p95 ms', 'max ms', 'bytes parsed', 'cpu s'))
+
+    all_stats = []
+    for date, cycle_stats in date_stats.items():
+        all_stats.extend(cycle_stats)
+        print_benchmark_row(BENCHMARK_ROW, date, cycle_stats)
+    print_benchmark_row(BENCHMARK_ROW, 'total', all_stats)
+
+
+def print_benchmark_row(row_format, label, cycle_stats):
+    latencies = [stats['latency'] * 1000 for stats in cycle_stats]
+    print(row_format.format(
+        label,
+        len(cycle_stats),
+        sum(stats['requests'] for stats in cycle_stats),
+        '%.1f' % get_percentile(latencies, 50),
+        '%.1f' % get_percentile(latencies, 95),
+        '%.1f' % max(latencies, default=0),
+        sum(stats['bytes_parsed'] for stats in cycle_stats),
+        '%.3f' % sum(stats['cpu_time'] for stats in cycle_stats),
+    ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record and replay statsapi feeds for the No-Hitter Tracker.')
+    parser.add_argument('mode', choices=['record', 'replay', 'bench'])
+    parser.add_argument('recording_dir')
+    parser.add_argument('--date', default=datetime.date.today().strftime('%m/%d/%Y'), help='Date to record, MM/DD/YYYY (default today)')
+    parser.add_argument('--interval', type=int, default=30, help='Seconds between recorded snapshots (default 30)')
+    parser.add_argument('--config', help='Config file to replay with (default: main.py defaults)')
+    args = parser.parse_args()
+
+    logging.addLevelName(logging.DEBUG, 'DBG')
+    logging.addLevelName(logging.WARNING, 'WRN')
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO if args.mode != 'bench' else logging.WARNING, format='%(asctime)s - [%(levelname).3s] %(message)s')
+
+    if args.mode == 'record':
+        record(args.recording_dir, args.date, args.interval)
+    else:
+        config_data = {}
+        if args.config:
+            with open(args.config, 'r') as file:
+                config_data = json.load(file)
+
+        date_stats = replay(args.recording_dir, config_data, print_tweets=args.mode == 'replay')
+        if args.mode == 'bench':
+            print_benchmark(date_stats)
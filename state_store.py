@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+
+# No-Hitter Tracker
+#   Persistent store for the no-hitters that have been tweeted and the notifications waiting to be sent, so a restart mid-game doesn't re-tweet or miss a "broken"/"finished" follow-up.
+#   State is kept in a SQLite database in WAL mode; every write is its own transaction, so the service can be stopped at any time.
+
+import logging
+import threading
+import time
+import sqlite3
+
+CREATE_TABLE = '''CREATE TABLE IF NOT EXISTS tweeted_no_hitters (
+    date TEXT NOT NULL,
+    game_id INTEGER NOT NULL,
+    team_id INTEGER NOT NULL,
+    is_perfect_game INTEGER NOT NULL,
+    is_finished INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (date, game_id, team_id)
+)'''
+CREATE_PENDING_NOTIFICATIONS_TABLE = '''CREATE TABLE IF NOT EXISTS pending_notifications (
+    sink TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    is_sent INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (sink, key)
+)'''
+CREATE_GAME_INDEX = 'CREATE INDEX IF NOT EXISTS tweeted_no_hitters_game_id ON tweeted_no_hitters (game_id)'
+
+connection = None
+connection_lock = threading.Lock()
+
+
+def open_store(path):
+    global connection
+    try:
+        new_connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False) # Autocommit; each statement is an atomic transaction.
+        new_connection.execute('PRAGMA journal_mode=WAL')
+        new_connection.execute('PRAGMA synchronous=FULL')
+        new_connection.execute(CREATE_TABLE)
+        new_connection.execute(CREATE_GAME_INDEX)
+        new_connection.execute(CREATE_PENDING_NOTIFICATIONS_TABLE)
+        connection = new_connection
+    except sqlite3.Error as e:
+        logging.exception('An error occurred and the state store could not be opened: ' + str(e))
+    return connection
+
+
+def save_team_state(date, game_id, team_id, is_perfect_game, is_finished):
+    if connection is None:
+        return
+
+    try:
+        with connection_lock:
+            connection.execute('INSERT OR REPLACE INTO tweeted_no_hitters VALUES (?, ?, ?, ?, ?, ?)', (date, game_id, team_id, int(is_perfect_game), int(is_finished), time.time()))
+    except sqlite3.Error as e:
+        logging.exception('An error occurred and the tweeted state was not saved: ' + str(e))
+
+
+def load_game_states(game_id): # Returns a list of (team_id, is_perfect_game, is_finished) for the specified game, using the latest state saved on any date.
+    if connection is None:
+        return []
+
+    try:
+        with connection_lock:
+            rows = connection.execute('SELECT team_id, is_perfect_game, is_finished FROM tweeted_no_hitters WHERE game_id = ? ORDER BY updated_at', (game_id,)).fetchall()
+        team_states = {} # Later rows replace earlier ones for suspended games that were resumed on another date.
+        for team_id, is_perfect_game, is_finished in rows:
+            team_states[team_id] = (team_id, bool(is_perfect_game), bool(is_finished))
+        return list(team_states.values())
+    except sqlite3.Error as e:
+        logging.exception('An error occurred and the tweeted state was not loaded: ' + str(e))
+    return []
+
+
+def save_pending_notification(sink, key, status): # Returns False if a notification with the same key was already saved for the sink, whether or not it has been sent.
+    if connection is None:
+        return True
+
+    try:
+        with connection_lock:
+            cursor = connection.execute('INSERT OR IGNORE INTO pending_notifications VALUES (?, ?, ?, 0, ?)', (sink, key, status, time.time()))
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logging.exception('An error occurred and the pending notification was not saved: ' + str(e))
+    return True
+
+
+def mark_notification_sent(sink, key):
+    if connection is None:
+        return
+
+    try:
+        with connection_lock:
+            connection.execute('UPDATE pending_notifications SET is_sent = 1 WHERE sink = ? AND key = ?', (sink, key))
+    except sqlite3.Error as e:
+        logging.exception('An error occurred and the notification was not marked as sent: ' + str(e))
+
+
+def load_pending_notifications(sink): # Returns a list of (key, status) for the notifications that haven't been sent to the sink yet, oldest first.
+    if connection is None:
+        return []
+
+    try:
+        with connection_lock:
+            return connection.execute('SELECT key, status FROM pending_notifications WHERE sink = ? AND is_sent = 0 ORDER BY created_at', (sink,)).fetchall()
+    except sqlite3.Error as e:
+        logging.exception('An error occurred and the pending notifications were not loaded: ' + str(e))
+    return []
+
+
+def close_store():
+    global connection
+    if connection is not None:
+        connection.close()
+        connection = None